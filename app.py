@@ -1,48 +1,70 @@
 # app.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 import gspread
-from gspread.exceptions import WorksheetNotFound
+from gspread.exceptions import APIError
 from google.oauth2.service_account import Credentials
 from datetime import datetime, date
+from pathlib import Path
+from io import BytesIO
+from functools import lru_cache
+from types import MappingProxyType
+import hashlib
+import os
+import tempfile
+import re
 from typing import Dict, List, Tuple, Optional, Set
 
 # =============================
 # GENEL AYARLAR
 # =============================
 st.set_page_config(page_title="Yoklama – Koç Telefon Paneli", layout="wide")
+# Filtre sonrası alt kümeler ancak yazılınca kopyalanır; ara .copy() çağrılarına gerek yok
+pd.set_option("mode.copy_on_write", True)
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
 DEFAULT_SHEET_KEY = "1WogWAT7rt6MANHORr2gd5E787Q_Zo0KtfrQkU1Tazfk"
 DEFAULT_STUDENTS_WORKSHEET_NAME = "Ogrenciler"
 DEFAULT_ATTENDANCE_WORKSHEET_NAME = "Yoklama"
+# Sayfa okumalarının revizyon bazlı parquet önbelleği
+CACHE_DIR = Path(".cache")
 
 # Koç ID ↔ İsim eşleşmesi
 COACH_ID_TO_NAME = {"1": "GOKHAN", "2": "SINAN", "3": "EMRE", "4": "TUGAY"}
 COACH_NAME_TO_ID = {name.lower(): cid for cid, name in COACH_ID_TO_NAME.items()}
 
-MEMBERSHIP_STATUS_LABELS = {0: "Pasif", 1: "Aktif", 2: "Dondurulmuş"}
+# Sabit tablolar salt okunur: frozenset / MappingProxyType
+MEMBERSHIP_STATUS_LABELS = MappingProxyType({0: "Pasif", 1: "Aktif", 2: "Dondurulmuş"})
+# Sayfadaki serbest metin → durum kodu (küçük harfe çevrilip Türkçe karakterler sadeleştirildikten sonra)
+MEMBERSHIP_STATUS_CODE_MAP = MappingProxyType({
+    "1": 1, "aktif": 1, "active": 1,
+    "2": 2, "dondurulmus": 2, "frozen": 2, "askida": 2, "askiya": 2,
+    "0": 0, "pasif": 0, "inactive": 0, "kapali": 0, "off": 0,
+})
 # Dondurulmuş (2) öğrencileri de listelesin istiyorsanız {1,2}; sadece Aktif için {1}
-MEMBERSHIP_STATUS_ACTIVE_CODES = {1}
+MEMBERSHIP_STATUS_ACTIVE_CODES = frozenset({1})
 
-TRUTHY_STRINGS = {
+TRUTHY_STRINGS = frozenset({
     "1","true","yes","evet","var","✔","✔️","x","✓","✅","active","aktif","açık","acik","on","open","geldi"
-}
-ATTENDANCE_OPTIONS = ("✔️ VAR", "✖️ YOK")
+})
+ATTENDANCE_COLUMNS = ["Tarih","Grup","OgrenciID","AdSoyad","Koc","Katildi","Not","Timestamp"]
 
 # =============================
 # YARDIMCI FONKSİYONLAR
 # =============================
+# Türkçe karakter sadeleştirme tablosu (ç→c, ğ→g, ı→i, ö→o, ş→s, ü→u)
+_TT = str.maketrans("çğıöşü", "cgiosu")
+
+@lru_cache(maxsize=256)
 def _simplify_token(s: str) -> str:
-    return (
-        str(s)
-        .replace("ç","c").replace("ğ","g").replace("ı","i")
-        .replace("ö","o").replace("ş","s").replace("ü","u")
-    )
+    return str(s).translate(_TT)
+
+_CLEAN_RE = re.compile(r"[_\s]+")
 
+@lru_cache(maxsize=256)
 def _normalize_colname(name: str) -> str:
-    s = _simplify_token(str(name)).lower().strip()
-    return s.replace("_","").replace(" ","")
+    return _CLEAN_RE.sub("", str(name).translate(_TT).lower())
 
 CANONICAL_COLMAP = {
     # ID
@@ -74,25 +96,6 @@ def _canonicalize_columns(df: pd.DataFrame) -> pd.DataFrame:
         df = df.rename(columns=renames)
     return df
 
-def _normalize_coach_pair(raw_value: object) -> Tuple[str, str]:
-    """
-    '2' → ('SINAN','2'), 'SINAN' → ('SINAN','2'); bilinmiyorsa ('ham','')
-    """
-    t = str(raw_value).strip()
-    if not t or t.lower() in {"nan","none"}:
-        return "", ""
-    # ID?
-    try:
-        num = str(int(float(t)))
-        if num in COACH_ID_TO_NAME:
-            return COACH_ID_TO_NAME[num], num
-    except:
-        pass
-    # İsim?
-    name = t.strip()
-    cid = COACH_NAME_TO_ID.get(name.lower(),"")
-    return (name if name else "", cid)
-
 def _get_sheet_settings():
     s = st.secrets.get("sheet", {})
     key = s.get("key", DEFAULT_SHEET_KEY)
@@ -105,6 +108,11 @@ def _gspread_client():
     creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=SCOPES)
     return gspread.authorize(creds)
 
+@st.cache_resource(show_spinner=False)
+def _spreadsheet():
+    key, _, _ = _get_sheet_settings()
+    return _gspread_client().open_by_key(key)
+
 @st.cache_data(show_spinner=False)
 def load_users_from_secrets() -> Dict[str, Dict]:
     # secrets.toml → [credentials.X] password="..."
@@ -114,14 +122,172 @@ def load_users_from_secrets() -> Dict[str, Dict]:
 # =============================
 # VERİ OKUMA/YAZMA
 # =============================
+def _values_to_df(values: List[List[str]]) -> pd.DataFrame:
+    """
+    Ham hücre değerlerini (ilk satır başlık) DataFrame'e çevirir; kısa satırları '' ile tamamlar.
+    """
+    if not values:
+        return pd.DataFrame()
+    header = [str(h).strip() for h in values[0]]
+    width = len(header)
+    rows = [list(r[:width]) + [""]*(width-len(r)) for r in values[1:]]
+    return pd.DataFrame(rows, columns=header)
+
+def _fetch_students_values(ws_students: str) -> List[List[str]]:
+    """
+    Sadece Ogrenciler aralığını okur. Yoklama geçmişi her gün büyüdüğü için burada çekilmez;
+    gerekirse load_yoklama ayrıca okur.
+    """
+    return _spreadsheet().values_get(f"'{ws_students}'!A:Z").get("values", [])
+
+def _cache_path(key: str, ws_students: str, rev: str) -> Path:
+    tag = hashlib.sha1(f"{ws_students}|{rev}".encode("utf-8")).hexdigest()[:12]
+    return CACHE_DIR / f"{key}_{tag}_students.parquet"
+
+def _clear_disk_cache():
+    """Diskteki parquet önbelleğini siler; sonraki okuma doğrudan Sheets'ten yapılır."""
+    key, _, _ = _get_sheet_settings()
+    for old in CACHE_DIR.glob(f"{key}_*.parquet"):
+        old.unlink(missing_ok=True)
+
 @st.cache_data(show_spinner=False)
-def load_students() -> pd.DataFrame:
+def _read_students_sheet() -> pd.DataFrame:
+    """
+    Ham Ogrenciler tablosunu döner. Sonuç, sayfanın Drive'daki son değişiklik zamanına
+    (modifiedTime) göre diskte parquet olarak saklanır; sayfa değişmediyse yeniden
+    başlatmalardan sonra da tekrar indirilmez.
+    """
+    key, ws_students, _ = _get_sheet_settings()
+    try:
+        rev = _spreadsheet().get_lastUpdateTime()
+    except Exception:
+        rev = None
+
+    path = _cache_path(key, ws_students, rev) if rev else None
+    if path is not None and path.exists():
+        try:
+            return pd.read_parquet(path)
+        except Exception:
+            pass
+
+    df = _values_to_df(_fetch_students_values(ws_students))
+
+    if path is not None:
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # Eski revizyonları sil
+            for old in CACHE_DIR.glob(f"{key}_*.parquet"):
+                if old != path:
+                    old.unlink(missing_ok=True)
+            # Geçici dosyaya yazıp yerine taşı: eşzamanlı yazanlar yarım dosya bırakmaz
+            fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    df.to_parquet(f, index=False)
+                os.replace(tmp, path)
+            finally:
+                Path(tmp).unlink(missing_ok=True)
+        except Exception:
+            # Disk önbelleği opsiyonel; yazılamazsa sadece bellek önbelleği kullanılır
+            pass
+    return df
+
+def _coach_candidates(username: str) -> Tuple[Set[str], Set[str]]:
+    """
+    Kullanıcı adının eşleşebileceği koç anahtarları: (sadeleştirilmiş küçük harf isimler, ID'ler)
+    """
+    uname = str(username).strip()
+    uname_lower = uname.lower()
+
+    cand_ids: Set[str] = set()
+    cand_names: Set[str] = {uname, uname_lower, _simplify_token(uname_lower)}
+    if uname_lower in COACH_NAME_TO_ID:
+        cand_ids.add(COACH_NAME_TO_ID[uname_lower])
+
+    # Eğer kullanıcı adı ID ise (isim girişinde istisna yoluna hiç girilmez)
+    num = str(int(uname)) if uname.isdecimal() else ""
+    if not num and "." in uname:
+        try:
+            num = str(int(float(uname)))
+        except (ValueError, OverflowError):
+            pass
+    if num:
+        cand_ids.add(num)
+        if num in COACH_ID_TO_NAME:
+            cand_names.add(COACH_ID_TO_NAME[num]); cand_names.add(COACH_ID_TO_NAME[num].lower())
+
+    return {_simplify_token(n.lower()) for n in cand_names}, {i.lower() for i in cand_ids}
+
+def _col_letter(idx: int) -> str:
+    # 0 → A, 25 → Z, 26 → AA
+    letters = ""
+    idx += 1
+    while idx:
+        idx, r = divmod(idx - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+# Sadeleştirilmiş harfi, sayfadaki Türkçe karşılıklarıyla da eşleştiren regex parçaları
+_GVIZ_UNFOLD = {"c": "[cç]", "g": "[gğ]", "i": "[iı]", "o": "[oö]", "s": "[sş]", "u": "[uü]"}
+
+def _coach_tq(header: List[str], name_keys: Set[str], id_keys: Set[str]) -> Optional[str]:
+    """
+    Başlık satırına göre koçun satırlarını seçen gviz sorgusu; Koc/KocID sütunu yoksa None.
+    matches tüm hücreyle eşleşir; istemci tarafı strip() ettiği için baş/son boşluklara izin verilir.
+    """
+    cols = {CANONICAL_COLMAP.get(_normalize_colname(h)): i for i, h in enumerate(header)}
+    conds = []
+    if "Koc" in cols:
+        koc = _col_letter(cols["Koc"])
+        conds += [
+            f"lower({koc}) matches '\\s*" + "".join(_GVIZ_UNFOLD.get(ch, re.escape(ch)) for ch in k) + "\\s*'"
+            for k in sorted(name_keys) if k and "'" not in k and "\\" not in k
+        ]
+        conds += [f"{koc} matches '\\s*{i}\\s*'" for i in sorted(id_keys) if i.isdecimal()]
+    if "KocID" in cols:
+        conds += [f"{_col_letter(cols['KocID'])} = {i}" for i in sorted(id_keys) if i.isdecimal()]
+    return "select * where " + " or ".join(conds) if conds else None
+
+def _query_students_for_coach(username: str) -> Optional[pd.DataFrame]:
+    """
+    Ogrenciler sekmesinden sadece bu koça ait olabilecek satırları gviz sorgusuyla (sunucu tarafında) çeker.
+    secrets'ta [sheet] server_side_filter = true değilse veya sorgu kurulamaz/başarısız olursa None döner
+    (çağıran tam okumaya düşer). Not: gviz her sütuna tek tip atar; Koc/KocID sütununda isim ve sayı
+    karışıksa azınlıktaki hücreler boş gelir, bu durumda bayrağı kapalı tutun.
+    """
+    if not st.secrets.get("sheet", {}).get("server_side_filter", False):
+        return None
+    key, ws_students, _ = _get_sheet_settings()
+    try:
+        header = (_spreadsheet().values_get(f"'{ws_students}'!1:1").get("values") or [[]])[0]
+        tq = _coach_tq(header, *_coach_candidates(username))
+        if tq is None:
+            return None
+        resp = _gspread_client().http_client.request(
+            "get",
+            f"https://docs.google.com/spreadsheets/d/{key}/gviz/tq",
+            params={"tqx": "out:csv", "sheet": ws_students, "headers": 1, "tq": tq},
+        )
+        return pd.read_csv(BytesIO(resp.content), dtype=str, keep_default_na=False)
+    except Exception:
+        return None
+
+@st.cache_resource(show_spinner=False)
+def load_students(coach_filter: Optional[str] = None) -> pd.DataFrame:
+    """
+    Aktif öğrenci listesi. coach_filter verilirse satırlar mümkünse sunucu tarafında o koça göre
+    süzülür (bkz. _query_students_for_coach); aksi halde tüm sayfa okunur.
+    Sonuç tüm oturumlarla paylaşılır (her çağrıda pickle kopyası yok);
+    salt okunur kullanın, değiştirecekseniz önce .copy() alın.
+    """
     empty = pd.DataFrame(columns=["OgrenciID","AdSoyad","Grup","Koc","KocID","UyelikDurumu","UyelikDurumuKodu"])
     try:
-        key, ws_students, _ = _get_sheet_settings()
-        gc = _gspread_client()
-        ws = gc.open_by_key(key).worksheet(ws_students)
-        df = pd.DataFrame(ws.get_all_records())
+        df = _query_students_for_coach(coach_filter) if coach_filter else None
+        if df is None:
+            if coach_filter:
+                # Sunucu filtresi yok: tam listenin paylaşılan önbelleğini kullan
+                return load_students()
+            df = _read_students_sheet()
     except Exception as e:
         st.error(f"Öğrenciler okunamadı: {e}")
         return empty
@@ -135,81 +301,97 @@ def load_students() -> pd.DataFrame:
     for c in ["OgrenciID","AdSoyad","Grup","Koc","KocID","UyelikDurumu"]:
         if c not in df: df[c] = ""
 
-    # Koç isim/ID çöz
-    names, ids = [], []
-    for raw in df["Koc"]:
-        name, cid = _normalize_coach_pair(raw)
-        names.append(name); ids.append(cid)
+    # Koç isim/ID çöz: '2' → ('SINAN','2'), 'SINAN' → ('SINAN','2'); bilinmiyorsa ('ham','')
+    raw = df["Koc"].astype(str).str.strip()
+    raw = raw.mask(raw.str.lower().isin({"nan","none"}), "")
+    num = pd.to_numeric(raw, errors="coerce")
+    num_id = np.trunc(num.where(num.abs() < 1e15)).astype("Int64").astype(str)
+    id_name = num_id.map(COACH_ID_TO_NAME)
+    is_id = id_name.notna()
+    ids = num_id.where(is_id, raw.str.lower().map(COACH_NAME_TO_ID)).fillna("")
+    names = id_name.where(is_id, raw)
 
     # KocID sütunu doluysa boşları oradan tamamla
-    for i, cid in enumerate(ids):
-        if not cid:
-            cid2 = str(df.loc[i,"KocID"]).strip()
-            if cid2:
-                ids[i] = cid2
-                names[i] = COACH_ID_TO_NAME.get(cid2, names[i])
+    kid = df["KocID"].astype(str).str.strip()
+    fill = (ids == "") & (kid != "")
+    ids = ids.mask(fill, kid)
+    names = names.mask(fill, kid.map(COACH_ID_TO_NAME).fillna(names))
 
     df["Koc"] = names
     df["KocID"] = ids
 
     # Üyelik durumunu koda çevir
-    codes = []
-    for v in df["UyelikDurumu"]:
-        s = _simplify_token(str(v)).lower().strip()
-        if s in {"1","aktif","active"}: codes.append(1)
-        elif s in {"2","dondurulmus","dondurulmuş","frozen","askida","askiya","askıya"}: codes.append(2)
-        elif s in {"0","pasif","inactive","kapali","kapalı","off"}: codes.append(0)
-        else:
-            try:
-                n = int(float(s)); codes.append(n if n in (0,1,2) else 1)
-            except:
-                codes.append(1)
+    status = df["UyelikDurumu"].astype(str).str.lower().str.translate(_TT).str.strip()
+    # Tanınmayan sayısal değerler ve metinler Aktif (1) sayılır
+    num = np.trunc(pd.to_numeric(status, errors="coerce"))
+    codes = status.map(MEMBERSHIP_STATUS_CODE_MAP).fillna(num.where(num.isin([0,1,2]), 1)).astype(int)
     df["UyelikDurumuKodu"] = codes
-    df["UyelikDurumu"] = [MEMBERSHIP_STATUS_LABELS.get(c,"") for c in codes]
+    df["UyelikDurumu"] = codes.map(MEMBERSHIP_STATUS_LABELS)
 
     # Aktif/dondurulmuş filtre
-    df = df[df["UyelikDurumuKodu"].isin(MEMBERSHIP_STATUS_ACTIVE_CODES)].copy()
+    df = df[df["UyelikDurumuKodu"].isin(MEMBERSHIP_STATUS_ACTIVE_CODES)]
 
-    # Temizlik
-    df[["OgrenciID","AdSoyad","Grup","Koc","KocID"]] = (
-        df[["OgrenciID","AdSoyad","Grup","Koc","KocID"]].astype(str).apply(lambda c: c.str.strip())
-    )
+    # Temizlik: Arrow tabanlı metin; strip ve sonraki .str işlemleri pyarrow çekirdeğinde
+    text_cols = ["OgrenciID","AdSoyad","Grup","Koc","KocID"]
+    df[text_cols] = df[text_cols].astype("string[pyarrow]").apply(lambda c: c.str.strip())
     # Boş kimlik ve adları ele
-    df = df[(df["OgrenciID"]!="") | (df["AdSoyad"]!="")].copy()
+    df = df[(df["OgrenciID"]!="") | (df["AdSoyad"]!="")]
+
+    # Koç eşleştirmesi için normalize anahtarlar (get_students_for_coach her çağrıda yeniden hesaplamasın)
+    df["_koc_key"] = df["Koc"].str.lower().str.translate(_TT)
+    df["_kocid_key"] = df["KocID"].str.lower()
+
+    # Az sayıda farklı değer: kategorik (isin/unique/sıralama kodlar üzerinden)
+    for c in ["Grup","Koc","UyelikDurumu"]:
+        df[c] = df[c].astype("category")
 
     return df
 
-@st.cache_data(show_spinner=False)
+@st.cache_resource(show_spinner=False)
 def load_yoklama() -> pd.DataFrame:
+    """
+    Yoklama kayıtları; ilk kullanımda ayrıca okunur, load_students gibi paylaşılır ve salt okunurdur.
+    """
+    empty = pd.DataFrame(columns=ATTENDANCE_COLUMNS)
+    _, _, ws_att = _get_sheet_settings()
     try:
-        key, _, ws_att = _get_sheet_settings()
-        gc = _gspread_client()
-        ws = gc.open_by_key(key).worksheet(ws_att)
-        df = pd.DataFrame(ws.get_all_records())
-    except WorksheetNotFound:
-        return pd.DataFrame(columns=["Tarih","Grup","OgrenciID","AdSoyad","Koc","Katildi","Not","Timestamp"])
+        values = _spreadsheet().values_get(f"'{ws_att}'!A:H").get("values", [])
+    except APIError as e:
+        # Yoklama sekmesi henüz yoksa (400, geçersiz aralık) boş dön; 429/5xx gibi hatalar yutulmaz
+        if e.code != 400:
+            raise
+        return empty
     except Exception as e:
         st.error(f"Yoklama okunamadı: {e}")
-        return pd.DataFrame(columns=["Tarih","Grup","OgrenciID","AdSoyad","Koc","Katildi","Not","Timestamp"])
+        return empty
 
+    df = _values_to_df(values)
     if df.empty:
-        return pd.DataFrame(columns=["Tarih","Grup","OgrenciID","AdSoyad","Koc","Katildi","Not","Timestamp"])
+        return empty
 
-    for c in ["Grup","OgrenciID","AdSoyad","Koc","Not"]:
-        if c in df: df[c] = df[c].astype(str).str.strip()
+    # Ham değerler zaten metin; astype(str) gerekmez
+    cols = [c for c in ["Grup","OgrenciID","AdSoyad","Koc","Not"] if c in df]
+    if cols:
+        df[cols] = df[cols].astype("string[pyarrow]").apply(lambda s: s.str.strip())
     if "Katildi" in df:
-        df["Katildi"] = df["Katildi"].astype(str).str.lower().isin({"true","1","evet","yes"})
+        # Arrow üzerinde isin → pyarrow is_in (hash), ara nesne dizisi yok
+        df["Katildi"] = df["Katildi"].astype("string[pyarrow]").str.strip().str.lower().isin(TRUTHY_STRINGS)
     return df
 
-def append_yoklama_rows(records: List[Dict]):
-    key, _, ws_att = _get_sheet_settings()
-    gc = _gspread_client()
-    ws = gc.open_by_key(key).worksheet(ws_att)
+@st.cache_resource(show_spinner=False)
+def _ensure_header(ws_att: str) -> bool:
+    """
+    Yoklama sekmesinin ilk satırına bakar (tüm sayfayı değil), başlık yoksa yazar.
+    Süreç başına bir kez çalışır.
+    """
+    ss = _spreadsheet()
+    if not ss.values_get(f"'{ws_att}'!1:1").get("values"):
+        ss.values_update(f"'{ws_att}'!A1:H1", params={"valueInputOption": "RAW"}, body={"values": [ATTENDANCE_COLUMNS]})
+    return True
 
-    # Başlık yoksa yaz
-    all_vals = ws.get_all_values()
-    if not all_vals:
-        ws.update("A1:H1", [["Tarih","Grup","OgrenciID","AdSoyad","Koc","Katildi","Not","Timestamp"]])
+def append_yoklama_rows(records: List[Dict]):
+    _, _, ws_att = _get_sheet_settings()
+    _ensure_header(ws_att)
 
     values = []
     for r in records:
@@ -224,45 +406,19 @@ def append_yoklama_rows(records: List[Dict]):
             r.get("Timestamp",""),
         ])
     if values:
-        ws.append_rows(values, value_input_option="USER_ENTERED")
+        _spreadsheet().values_append(
+            f"'{ws_att}'!A:H",
+            params={"valueInputOption": "USER_ENTERED", "insertDataOption": "INSERT_ROWS"},
+            body={"values": values},
+        )
 
 @st.cache_data(show_spinner=False)
 def get_students_for_coach(username: str) -> pd.DataFrame:
-    df = load_students()
+    df = load_students(coach_filter=str(username).strip())
     if df.empty:
         return df
-    uname = str(username).strip()
-    uname_lower = uname.lower()
-
-    cand_ids: Set[str] = set()
-    cand_names: Set[str] = {uname, uname_lower, _simplify_token(uname_lower)}
-    if uname_lower in COACH_NAME_TO_ID:
-        cand_ids.add(COACH_NAME_TO_ID[uname_lower])
-
-    # Eğer kullanıcı adı ID ise
-    try:
-        num = str(int(float(uname)))
-        cand_ids.add(num)
-        if num in COACH_ID_TO_NAME:
-            cand_names.add(COACH_ID_TO_NAME[num]); cand_names.add(COACH_ID_TO_NAME[num].lower())
-    except:
-        pass
-
-    mask = pd.Series([False]*len(df), index=df.index)
-    if "Koc" in df:
-        col = df["Koc"].astype(str)
-        col_lower = col.str.lower()
-        col_simple = col_lower.apply(_simplify_token)
-        mask = mask | col_lower.isin({n.lower() for n in cand_names}) | col_simple.isin({_simplify_token(n.lower()) for n in cand_names})
-    if "KocID" in df:
-        col = df["KocID"].astype(str).str.strip()
-        col_lower = col.str.lower()
-        mask = mask | col.isin(cand_ids) | col_lower.isin(cand_ids)
-
-    if mask.any():
-        out = df[mask].copy()
-    else:
-        out = df[df["Koc"].str.lower()==uname_lower].copy()
+    name_keys, id_keys = _coach_candidates(username)
+    out = df[df["_koc_key"].isin(name_keys) | df["_kocid_key"].isin(id_keys)]
 
     if out.empty:
         return pd.DataFrame(columns=["OgrenciID","AdSoyad","Grup","Koc","KocID","UyelikDurumu","UyelikDurumuKodu"])
@@ -307,12 +463,65 @@ def login_view(users: Dict[str, Dict]) -> Tuple[str, bool]:
 # =============================
 # ARAYÜZ – GRUP FİLTRELİ YOKLAMA
 # =============================
+@st.fragment
+def attendance_form(df_students: pd.DataFrame, date_str: str, username: str):
+    """
+    Yoklama tablosu ve kaydetme. Fragment olarak çalışır: kaydet sadece bu bölümü yeniden çalıştırır,
+    giriş/öğrenci listesi/grup seçimi tekrar işlenmez.
+    """
+    st.markdown("---")
+    st.markdown("### ✅ Yoklama Listesi")
+    # Tek tablo widget'ı: öğrenci başına ayrı radio/expander yerine sütun bazlı durum
+    df_view = df_students[["OgrenciID","AdSoyad","Grup","UyelikDurumu"]].assign(Katildi=False, Not="")
+    editor_key = f"att_editor_{date_str}"
+    # Form: işaretlemeler her tıklamada rerun tetiklemez, kaydette tek seferde gönderilir
+    with st.form("yoklama", clear_on_submit=False):
+        edited = st.data_editor(
+            df_view,
+            column_config={
+                "OgrenciID": st.column_config.TextColumn("ID"),
+                "AdSoyad": st.column_config.TextColumn("Ad Soyad"),
+                "Grup": st.column_config.TextColumn("Grup"),
+                "UyelikDurumu": st.column_config.TextColumn("Durum"),
+                "Katildi": st.column_config.CheckboxColumn("✔️ VAR", default=False),
+                "Not": st.column_config.TextColumn("Not (opsiyonel)"),
+            },
+            disabled=["OgrenciID","AdSoyad","Grup","UyelikDurumu"],
+            hide_index=True,
+            use_container_width=True,
+            key=editor_key,
+        )
+        st.markdown("---")
+        genel_not = st.text_input("Günün genel notu (opsiyonel)", value="")
+        submitted = st.form_submit_button("💾 Yoklamayı Kaydet", type="primary", use_container_width=True)
+
+    if submitted:
+        # Formdaki tüm satırlar yazılır: işaretsiz öğrenci YOK demektir
+        now_iso = datetime.now().isoformat(timespec="seconds")
+        # Kayıtlar düzenlenen tablodan sütun bazlı tek geçişte üretilir
+        records = edited.assign(
+            Tarih=date_str,
+            OgrenciID=edited["OgrenciID"].astype(str),
+            Koc=username,
+            Katildi=edited["Katildi"].fillna(False).astype(bool),
+            Not=edited["Not"].fillna("").replace("", genel_not),
+            Timestamp=now_iso,
+        )[ATTENDANCE_COLUMNS].to_dict("records")
+        try:
+            append_yoklama_rows(records)
+            load_yoklama.clear()
+            st.success("Yoklama kaydedildi.")
+        except Exception as e:
+            st.error(f"Yazma hatası: {e}")
+
 def attendance_view(username: str):
     st.markdown(f"#### 👤 Oturum: **{username}**")
 
     # Yenile
     if st.button("🔄 Veriyi Yenile"):
-        load_students.clear(); get_students_for_coach.clear(); load_yoklama.clear()
+        # Drive modifiedTime Sheets düzenlemesinden geç güncellenebilir; disk önbelleğine güvenme
+        _clear_disk_cache()
+        _read_students_sheet.clear(); load_students.clear(); get_students_for_coach.clear(); load_yoklama.clear()
         st.experimental_rerun()
 
     # Koça ait öğrenciler
@@ -322,7 +531,7 @@ def attendance_view(username: str):
         return
 
     # Grup seçenekleri (benzersiz, boşları at)
-    groups_all = sorted(g for g in pd.Series(df_students_full["Grup"]).fillna("").astype(str).str.strip().unique() if g)
+    groups_all = [g for g in df_students_full["Grup"].cat.remove_unused_categories().cat.categories if g]
     default_groups = st.session_state.get("selected_groups", groups_all)
     selected_groups = st.multiselect(
         "📚 Grup seçin (birden fazla seçebilirsiniz)",
@@ -333,9 +542,9 @@ def attendance_view(username: str):
     st.session_state["selected_groups"] = selected_groups
 
     # Seçime göre filtre
-    df_students = df_students_full.copy()
+    df_students = df_students_full
     if selected_groups:
-        df_students = df_students[df_students["Grup"].isin(selected_groups)].copy()
+        df_students = df_students[df_students["Grup"].isin(selected_groups)]
 
     if df_students.empty:
         st.warning("Seçtiğiniz gruplarda öğrenci bulunamadı.")
@@ -346,56 +555,7 @@ def attendance_view(username: str):
     selected_date = st.date_input("📅 Tarih", value=today, format="DD.MM.YYYY")
     date_str = selected_date.strftime("%d.%m.%Y")
 
-    st.markdown("---")
-    st.markdown("### ✅ Yoklama Listesi")
-    present_map, note_map = {}, {}
-
-    for row in df_students.itertuples(index=False):
-        sid = str(row.OgrenciID)
-        status = getattr(row, "UyelikDurumu", "")
-        student_label = f"{row.AdSoyad} — (ID: {sid}) | Grup: {row.Grup}" + (f" | Durum: {status}" if status else "")
-        radio_key = f"att_{date_str}_{sid}"
-        note_key  = f"note_{date_str}_{sid}"
-
-        if radio_key not in st.session_state:
-            st.session_state[radio_key] = ATTENDANCE_OPTIONS[1]  # default: YOK
-
-        c1, c2 = st.columns([3,2])
-        with c1: st.markdown(f"**{student_label}**")
-        with c2:
-            st.radio("Yoklama", ATTENDANCE_OPTIONS, key=radio_key, horizontal=True, label_visibility="collapsed")
-
-        present_map[sid] = (st.session_state.get(radio_key) == ATTENDANCE_OPTIONS[0])
-        if note_key not in st.session_state: st.session_state[note_key] = ""
-        with st.expander("Not (opsiyonel)", expanded=False):
-            st.text_input("Not", key=note_key)
-        note_map[sid] = st.session_state[note_key]
-
-    st.markdown("---")
-    genel_not = st.text_input("Günün genel notu (opsiyonel)", value="")
-
-    if st.button("💾 Yoklamayı Kaydet", type="primary", use_container_width=True):
-        now_iso = datetime.now().isoformat(timespec="seconds")
-        sid_to_name  = dict(zip(df_students["OgrenciID"].astype(str), df_students["AdSoyad"]))
-        sid_to_group = dict(zip(df_students["OgrenciID"].astype(str), df_students["Grup"]))
-        records = []
-        for sid, present in present_map.items():
-            records.append({
-                "Tarih": date_str,
-                "Grup": sid_to_group.get(sid, ""),
-                "OgrenciID": sid,
-                "AdSoyad": sid_to_name.get(sid, ""),
-                "Koc": username,
-                "Katildi": bool(present),
-                "Not": note_map.get(sid) or genel_not,
-                "Timestamp": now_iso,
-            })
-        try:
-            append_yoklama_rows(records)
-            load_yoklama.clear()
-            st.success("Yoklama kaydedildi.")
-        except Exception as e:
-            st.error(f"Yazma hatası: {e}")
+    attendance_form(df_students, date_str, username)
 
 # =============================
 # ANA AKIŞ
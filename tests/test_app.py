@@ -0,0 +1,27 @@
+import re
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import app
+
+HEADER = ["OgrenciID", "AdSoyad", "Grup", "Koç", "KocID", "UyelikDurumu"]
+
+
+def test_coach_tq_allows_surrounding_whitespace():
+    tq = app._coach_tq(HEADER, {"sinan"}, {"2"})
+    assert tq == (
+        "select * where lower(D) matches '\\s*[sş][iı]nan\\s*'"
+        " or D matches '\\s*2\\s*'"
+        " or E = 2"
+    )
+    pattern = re.search(r"lower\(D\) matches '([^']*)'", tq).group(1)
+    for cell in ["sinan", "sinan ", "  sınan", "\tsinan\t"]:
+        assert re.fullmatch(pattern, cell)
+    assert not re.fullmatch(pattern, "sinanx")
+
+
+def test_coach_tq_without_coach_columns():
+    assert app._coach_tq(["OgrenciID", "AdSoyad"], {"sinan"}, {"2"}) is None